@@ -1 +1,4 @@
+from .categorize import Categorizer, Rule  # NOQA
 from .ec import ECImporter  # NOQA
+from .watch import Watcher  # NOQA
+from .writer import write_entries  # NOQA
@@ -0,0 +1,147 @@
+import re
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from beancount.core import data
+
+
+FIELDS = {
+    "payee": "Auftraggeber/Empfänger",
+    "booking_text": "Buchungstext",
+    "description": "Verwendungszweck",
+    "category": "Kategorie",
+}
+
+
+class Rule(NamedTuple):
+    keyword: str
+    account: data.Account
+    field: Optional[str] = None
+
+
+def _trie_pattern(trie: dict) -> str:
+    # Turns a character trie into a regular expression without any alternation
+    # between whole keywords, so matching costs the same for 10 or 10,000 rules.
+    # The trie is walked with an explicit stack, as it is as deep as the longest
+    # keyword.
+    patterns = {}
+    stack = [(trie, False)]
+
+    while stack:
+        node, visited = stack.pop()
+
+        if not visited:
+            stack.append((node, True))
+            stack.extend((child, False) for char, child in node.items() if char)
+            continue
+
+        branches = [
+            re.escape(char) + patterns.pop(id(child))
+            for char, child in sorted(node.items())
+            if char
+        ]
+
+        if not branches:
+            pattern = ""
+        elif len(branches) == 1 and "" not in node:
+            pattern = branches[0]
+        else:
+            pattern = "(?:{})".format("|".join(branches))
+
+            if "" in node:
+                pattern += "?"
+
+        patterns[id(node)] = pattern
+
+    return patterns[id(trie)]
+
+
+def _compile(keywords: Iterable[str]) -> re.Pattern:
+    trie: dict = {}
+
+    for keyword in keywords:
+        node = trie
+
+        for char in keyword:
+            node = node.setdefault(char, {})
+
+        node[""] = {}
+
+    return re.compile(_trie_pattern(trie))
+
+
+class Categorizer:
+    def __init__(self, rules: Iterable[Rule] = ()):
+        keywords: Dict[str, Dict[str, data.Account]] = {
+            column: {} for column in FIELDS.values()
+        }
+
+        for rule in rules:
+            if rule.field is None:
+                columns = FIELDS.values()
+            elif rule.field in FIELDS:
+                columns = (FIELDS[rule.field],)
+            else:
+                raise ValueError(f"unknown field: {rule.field}")
+
+            if not rule.keyword:
+                raise ValueError("keyword must not be empty")
+
+            for column in columns:
+                # the first rule for a keyword wins
+                keywords[column].setdefault(rule.keyword.casefold(), rule.account)
+
+        self._matchers = [
+            (column, _compile(accounts), accounts)
+            for column, accounts in keywords.items()
+            if accounts
+        ]
+        # counter account by payee, per account passed to learn()
+        self._payees: Dict[data.Account, Dict[str, data.Account]] = {}
+
+    def learn(self, entries: data.Entries, account: data.Account):
+        # Remember the counter account of the two-legged transactions on
+        # `account`, so that known payees are categorized without a rule.
+        # Payees booked against different counter accounts are left out.
+        counter_accounts: Dict[str, Set[data.Account]] = {}
+
+        for entry in entries:
+            if not isinstance(entry, data.Transaction) or not entry.payee:
+                continue
+
+            if len(entry.postings) != 2:
+                continue
+
+            accounts = [posting.account for posting in entry.postings]
+
+            if accounts[0] == account and accounts[1] != account:
+                other = accounts[1]
+            elif accounts[1] == account and accounts[0] != account:
+                other = accounts[0]
+            else:
+                continue
+
+            counter_accounts.setdefault(entry.payee, set()).add(other)
+
+        self._payees[account] = {
+            payee: others.pop()
+            for payee, others in counter_accounts.items()
+            if len(others) == 1
+        }
+
+    def categorize(
+        self, row: Dict[str, str], account: Optional[data.Account] = None
+    ) -> Optional[data.Account]:
+        for column, matcher, accounts in self._matchers:
+            value = row.get(column)
+
+            if not value:
+                continue
+
+            # both the keywords and the text are case folded, so that the
+            # matched text is always one of the keywords
+            match = matcher.search(value.casefold())
+
+            if match:
+                return accounts[match.group()]
+
+        return self._payees.get(account, {}).get(row.get(FIELDS["payee"]))
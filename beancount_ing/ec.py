@@ -1,35 +1,60 @@
+from contextlib import contextmanager
 import csv
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from itertools import count
 import re
 import warnings
-from typing import Optional
+from typing import Dict, Iterator, List, NamedTuple, Optional
 
 from beancount.core.amount import Amount
 from beancount.core import data, flags
 from beancount.core.number import Decimal
 from beangulp.importer import Importer
 
+from .categorize import Categorizer
+from .formats import (  # NOQA
+    BANKS,
+    META_KEYS,
+    PRE_HEADER,
+    InvalidFormatError,
+    Preamble,
+    open_export,
+    read_preamble,
+)
 
-BANKS = ("ING", "ING-DiBa")
-
-META_KEYS = ("IBAN", "Kontoname", "Bank", "Kunde", "Zeitraum", "Saldo")
 
-PRE_HEADER = (
-    "In der CSV-Datei finden Sie alle bereits gebuchten Umsätze. "
-    "Die vorgemerkten Umsätze werden nicht aufgenommen, auch wenn sie in "
-    "Ihrem Internetbanking angezeigt werden."
-)
+INTERN_TABLE_SIZE = 65536
 
+FIELD_SIZE_LIMIT = 2**31 - 1
 
-class InvalidFormatError(Exception):
-    pass
+ASCENDING = "ascending"
+DESCENDING = "descending"
 
 
 def _format_iban(iban):
     return re.sub(r"\s+", "", iban, flags=re.UNICODE)
 
 
+def _intern(table: dict, key, value=None):
+    # Returns the value stored for `key`, storing `value` (or `key` itself) as
+    # long as the table has not reached INTERN_TABLE_SIZE
+    if value is None:
+        value = key
+
+    try:
+        return table[key]
+    except KeyError:
+        if len(table) < INTERN_TABLE_SIZE:
+            table[key] = value
+
+        return value
+
+
+def _date_key(value: str) -> str:
+    # "DD.MM.YYYY" -> "YYYYMMDD", which sorts like the date it represents
+    return value[6:10] + value[3:5] + value[0:2]
+
+
 def _format_number_de(value: str) -> Decimal:
     thousands_sep = "."
     decimal_sep = ","
@@ -37,6 +62,78 @@ def _format_number_de(value: str) -> Decimal:
     return Decimal(value.replace(thousands_sep, "").replace(decimal_sep, "."))
 
 
+def _raise_field_size_limit():
+    # Verwendungszweck can get longer than the default limit of the csv module
+    # (128 KiB); the limit is global, so it is only ever raised
+    if csv.field_size_limit() < FIELD_SIZE_LIMIT:
+        csv.field_size_limit(FIELD_SIZE_LIMIT)
+
+
+def _records(fd):
+    # Yields (row, number of physical lines, source text) for every record of
+    # the body, reading `fd` one line at a time. Quoted fields may span lines.
+    _raise_field_size_limit()
+
+    lines = []
+
+    def _read_lines():
+        for line in fd:
+            lines.append(line)
+            yield line
+
+    reader = csv.reader(
+        _read_lines(), delimiter=";", quoting=csv.QUOTE_MINIMAL, quotechar='"'
+    )
+
+    for row in reader:
+        source = "".join(lines).strip()
+        line_count = len(lines)
+        lines.clear()
+
+        yield row, line_count, source
+
+
+def _check_fields(filepath: str, lineno: int, row: List[str], field_names):
+    if len(row) < len(field_names):
+        # e.g. the last line of a file which is still being written
+        raise InvalidFormatError(
+            f"{filepath}:{lineno}: expected {len(field_names)} fields, got {len(row)}"
+        )
+
+
+def _remap(names):
+    # https://stackoverflow.com/a/31771695
+    counter = count(1)
+
+    return [
+        "Währung_{}".format(next(counter)) if name == "Währung" else name
+        for name in names
+    ]
+
+
+def _sort_order(preamble: Preamble) -> Optional[str]:
+    if preamble.sorting:
+        if re.match(".*Datum absteigend", preamble.sorting):
+            return DESCENDING
+        if re.match(".*Datum aufsteigend", preamble.sorting):
+            return ASCENDING
+
+    return None
+
+
+class Summary(NamedTuple):
+    account: data.Account
+    iban: str
+    date_from: date
+    date_to: date
+    rows: int
+    # sums of the positive / negative amounts, per currency
+    credits: Dict[str, Decimal]
+    debits: Dict[str, Decimal]
+    # balance after the latest transaction (None unless sorted by date)
+    balance: Optional[Amount]
+
+
 class ECImporter(Importer):
     def __init__(
         self,
@@ -44,11 +141,19 @@ class ECImporter(Importer):
         account_name: str,
         user: str,
         file_encoding: Optional[str] = "ISO-8859-1",
+        min_date: Optional[date] = None,
+        max_date: Optional[date] = None,
+        incremental: bool = False,
+        categorizer: Optional[Categorizer] = None,
     ):
         self.iban = _format_iban(iban)
         self.account_name = account_name
         self.user = user
         self.file_encoding = file_encoding
+        self.min_date = min_date
+        self.max_date = max_date
+        self.incremental = incremental
+        self.categorizer = categorizer
 
         self._date_from = None
         self._date_to = None
@@ -57,214 +162,283 @@ class ECImporter(Importer):
     def account(self, filepath: str) -> data.Account:
         return self.account_name
 
-    def _is_valid_first_header(self, line):
-        return line.startswith("Umsatzanzeige;Datei erstellt am")
+    def _date_window(self, existing: data.Entries = None):
+        min_date = self.min_date
+        max_date = self.max_date
+
+        if self.incremental and existing:
+            # resume from the latest transaction already booked on this account;
+            # rows on that same day are kept and left to deduplication
+            latest = max(
+                (
+                    entry.date
+                    for entry in existing
+                    if isinstance(entry, data.Transaction)
+                    and any(
+                        posting.account == self.account_name
+                        for posting in entry.postings
+                    )
+                ),
+                default=None,
+            )
 
-    def _is_valid_second_header(self, line):
-        return line == ";Letztes Update: aktuell"
+            if latest is not None and (min_date is None or latest > min_date):
+                min_date = latest
 
-    def identify(self, filepath: str):
-        with open(filepath, encoding=self.file_encoding) as fd:
+        return min_date, max_date
 
-            def _read_line():
-                return fd.readline().strip()
+    def _is_valid_meta(self, meta):
+        if "IBAN" in meta and _format_iban(meta["IBAN"][0]) != self.iban:
+            return False
 
-            # Header - first line
-            line = _read_line()
+        if "Bank" in meta and meta["Bank"][0] not in BANKS:
+            return False
 
-            if not self._is_valid_first_header(line):
-                return False
+        if "Kunde" in meta and meta["Kunde"][0] != self.user:
+            return False
 
-            # Header - second line (optional)
-            line = _read_line()
+        return True
 
-            if line:
-                if not self._is_valid_second_header(line):
-                    return False
-                # Empty line
-                line = _read_line()
+    def identify(self, filepath: str):
+        preamble = read_preamble(filepath, self.file_encoding)
 
-            if line:
-                return False
+        return preamble is not None and self._is_valid_meta(preamble.meta)
 
-            # Meta
-            lines = [_read_line() for _ in range(len(META_KEYS))]
+    @contextmanager
+    def _open(self, filepath: str):
+        # Yields the preamble and the rest of the file, reusing the preamble
+        # parsed by identify if the file has not changed since
+        with open_export(filepath, self.file_encoding) as (preamble, fd):
+            if preamble is None or not self._is_valid_meta(preamble.meta):
+                raise InvalidFormatError()
 
-            reader = csv.reader(
-                lines, delimiter=";", quoting=csv.QUOTE_MINIMAL, quotechar='"'
-            )
+            if "Zeitraum" in preamble.meta:
+                splits = preamble.meta["Zeitraum"][0].strip().split(" - ")
 
-            for line in reader:
-                key, value, *_ = line
+                if len(splits) != 2:
+                    raise InvalidFormatError()
 
-                if key == "IBAN" and _format_iban(value) != self.iban:
-                    return False
+                self._date_from = datetime.strptime(splits[0], "%d.%m.%Y").date()
+                self._date_to = datetime.strptime(splits[1], "%d.%m.%Y").date()
 
-                if key == "Bank" and value not in BANKS:
-                    return False
+            # "Saldo" is not a useful balance, because it is valid on the date of
+            # generating the CSV (see first header line) and not on the closing
+            # date of the transactions (see metadata field 'Zeitraum')
 
-                if key == "Kunde" and value != self.user:
-                    return False
+            yield preamble, fd
 
-        return True
+    def summarize(self, filepath: str) -> Summary:
+        """Aggregate a file in constant memory, without building any entries."""
 
-    def extract(self, filepath: str, existing: data.Entries = None):
-        entries = []
-        self._line_index = 0
+        with self._open(filepath) as (preamble, fd):
+            records = _records(fd)
 
-        def _read_line():
-            line = fd.readline().strip()
-            self._line_index += 1
+            header, header_lines, _ = next(records)
+            field_names = _remap(header)
+            amount_index = field_names.index("Betrag")
+            currency_index = field_names.index("Währung_2")
+            balance_index = field_names.index("Saldo")
+            balance_currency_index = field_names.index("Währung_1")
 
-            return line
+            rows = 0
+            credits: Dict[str, Decimal] = {}
+            debits: Dict[str, Decimal] = {}
+            first_balance = last_balance = None
 
-        def _read_empty_line():
-            line = _read_line()
+            # line number of the next record
+            lineno = preamble.line_count + header_lines + 1
 
-            if line:
-                raise InvalidFormatError()
+            for row, line_count, _ in records:
+                if not row:
+                    lineno += line_count
+                    continue
 
-        with open(filepath, encoding=self.file_encoding) as fd:
-            # Header - first line
-            line = _read_line()
+                _check_fields(filepath, lineno, row, field_names)
+                lineno += line_count
 
-            if not self._is_valid_first_header(line):
-                raise InvalidFormatError()
+                amount = _format_number_de(row[amount_index])
+                currency = row[currency_index]
 
-            # Header - second line (optional)
-            line = _read_line()
+                totals = debits if amount < 0 else credits
+                totals[currency] = totals.get(currency, Decimal(0)) + amount
 
-            if line:
-                if not self._is_valid_second_header(line):
-                    raise InvalidFormatError()
+                last_balance = (row[balance_index], row[balance_currency_index])
+                if first_balance is None:
+                    first_balance = last_balance
 
-                # Empty line
-                _read_empty_line()
+                rows += 1
 
-            # Meta
-            lines = [_read_line() for _ in range(len(META_KEYS))]
+        # The "Saldo" line of the preamble is the balance at the time of the
+        # export, so the balance is taken from the latest transaction instead,
+        # which is only known if the file is sorted by date
+        sort_order = _sort_order(preamble)
 
-            reader = csv.reader(
-                lines, delimiter=";", quoting=csv.QUOTE_MINIMAL, quotechar='"'
-            )
+        if sort_order == ASCENDING:
+            balance = last_balance
+        elif sort_order == DESCENDING:
+            balance = first_balance
+        else:
+            balance = None
 
-            for line in reader:
-                key, *values = line
-                self._line_index += 1
-
-                if key == "IBAN":
-                    if _format_iban(values[0]) != self.iban:
-                        raise InvalidFormatError()
-                elif key == "Bank":
-                    if values[0] not in BANKS:
-                        raise InvalidFormatError()
-                elif key == "Kunde":
-                    if values[0] != self.user:
-                        raise InvalidFormatError()
-                elif key == "Zeitraum":
-                    splits = values[0].strip().split(" - ")
-
-                    if len(splits) != 2:
-                        raise InvalidFormatError()
-
-                    self._date_from = datetime.strptime(splits[0], "%d.%m.%Y").date()
-                    self._date_to = datetime.strptime(splits[1], "%d.%m.%Y").date()
-                elif key == "Saldo":
-                    # actually this is not a useful balance, because it is
-                    # valid on the date of generating the CSV (see first header
-                    # line) and not on the closing date of the transactions
-                    # (see metadata field 'Zeitraum')
-                    pass
-
-            # Empty line
-            _read_empty_line()
-
-            # Pre-header line (or optional sorting line)
-            line = _read_line()
-
-            descending_by_date = ascending_by_date = None
-
-            if line.startswith("Sortierung"):
-                if re.match(".*Datum absteigend", line):
-                    descending_by_date = True
-                elif re.match(".*Datum aufsteigend", line):
-                    ascending_by_date = True
-                else:
-                    warnings.warn(
-                        f"{filepath}:{self._line_index}: "
-                        "balance assertions can only be generated "
-                        "if transactions are sorted by date"
-                    )
-                _read_empty_line()
+        return Summary(
+            self.account(filepath),
+            self.iban,
+            self._date_from,
+            self._date_to,
+            rows,
+            credits,
+            debits,
+            Amount(_format_number_de(balance[0]), balance[1]) if balance else None,
+        )
 
-                line = _read_line()
+    def extract(self, filepath: str, existing: data.Entries = None):
+        return list(self.iter_entries(filepath, existing))
 
-            if line != PRE_HEADER:
-                raise InvalidFormatError()
+    def iter_entries(
+        self, filepath: str, existing: data.Entries = None
+    ) -> Iterator[data.Directive]:
+        # Same as extract, but yields the entries while reading the file
+        min_date, max_date = self._date_window(existing)
 
-            # Empty line
-            _read_empty_line()
+        # compare dates as "YYYYMMDD" strings so that rows outside the window
+        # are dropped without parsing them
+        min_key = min_date.strftime("%Y%m%d") if min_date else None
+        max_key = max_date.strftime("%Y%m%d") if max_date else None
+
+        if self.categorizer:
+            self.categorizer.learn(existing or [], self.account_name)
+
+        with self._open(filepath) as (preamble, fd):
+            sort_order = _sort_order(preamble)
+
+            descending_by_date = sort_order == DESCENDING
+            ascending_by_date = sort_order == ASCENDING
+
+            if preamble.sorting and sort_order is None:
+                warnings.warn(
+                    f"{filepath}:{preamble.sorting_lineno}: "
+                    "balance assertions can only be generated "
+                    "if transactions are sorted by date"
+                )
 
             # Data entries
-            lines = [line.strip() for line in fd.readlines()]
-            reader = csv.reader(
-                lines, delimiter=";", quoting=csv.QUOTE_MINIMAL, quotechar='"'
-            )
+            records = _records(fd)
 
-            def remap(names):
-                # https://stackoverflow.com/a/31771695
-                counter = count(1)
+            header, header_lines, _ = next(records)
+            field_names = _remap(header)
 
-                return [
-                    "Währung_{}".format(next(counter)) if name == "Währung" else name
-                    for name in names
-                ]
+            # line number of the next record
+            self._line_index = preamble.line_count + header_lines + 1
 
-            field_names = remap(next(reader))
+            # Values repeating across rows (payees, descriptions, amounts, dates)
+            # are shared between entries instead of being stored once per row
+            strings = {}
+            amounts = {}
+            # negated amounts of the counter postings, keyed like `amounts`
+            counter_amounts = {}
+            dates = {}
 
             # memoize first and last transactions for balance assertion
             first_transaction = last_transaction = None
 
-            for index, row in enumerate(reader):
+            for row, line_count, source in records:
+                if not row:
+                    self._line_index += line_count
+                    continue
+
+                _check_fields(filepath, self._line_index, row, field_names)
+
                 line = dict(zip(field_names, row))
 
+                date = line["Buchung"]
+                date_key = _date_key(date)
+
+                if min_key and date_key < min_key:
+                    if descending_by_date:
+                        # everything below is older still
+                        break
+                    self._line_index += line_count
+                    continue
+
+                if max_key and date_key > max_key:
+                    if ascending_by_date:
+                        # everything below is newer still
+                        break
+                    self._line_index += line_count
+                    continue
+
                 # Mark first and last transaction together with line numbers
                 last_transaction = (self._line_index, line)
                 if first_transaction is None:
                     first_transaction = last_transaction
-                date = line["Buchung"]
-                payee = line["Auftraggeber/Empfänger"]
+                payee = _intern(strings, line["Auftraggeber/Empfänger"])
                 booking_text = line["Buchungstext"]
                 description = line["Verwendungszweck"]
                 amount = line["Betrag"]
                 currency = line["Währung_2"]
 
                 meta = data.new_metadata(filepath, self._line_index)
-                meta["__source__"] = lines[index]
+                meta["__source__"] = source
 
-                amount = Amount(_format_number_de(amount), currency)
-                date = datetime.strptime(date, "%d.%m.%Y").date()
+                amount_key = (amount, currency)
+                amount = amounts.get(amount_key)
 
-                description = "{} {}".format(booking_text, description).strip()
+                if amount is None:
+                    amount = Amount(
+                        _format_number_de(amount_key[0]), _intern(strings, currency)
+                    )
+                    _intern(amounts, amount_key, amount)
+
+                parsed_date = dates.get(date)
+
+                if parsed_date is None:
+                    parsed_date = datetime.strptime(date, "%d.%m.%Y").date()
+                    _intern(dates, date, parsed_date)
+
+                date = parsed_date
+
+                description = _intern(
+                    strings, "{} {}".format(booking_text, description).strip()
+                )
 
                 postings = [
                     data.Posting(self.account(filepath), amount, None, None, None, None)
                 ]
 
-                entries.append(
-                    data.Transaction(
-                        meta,
-                        date,
-                        flags.FLAG_OKAY,
-                        payee,
-                        description,
-                        data.EMPTY_SET,
-                        data.EMPTY_SET,
-                        postings,
-                    )
+                if self.categorizer:
+                    other_account = self.categorizer.categorize(line, self.account_name)
+
+                    if other_account:
+                        counter_amount = counter_amounts.get(amount_key)
+
+                        if counter_amount is None:
+                            counter_amount = _intern(
+                                counter_amounts, amount_key, -amount
+                            )
+
+                        postings.append(
+                            data.Posting(
+                                other_account,
+                                counter_amount,
+                                None,
+                                None,
+                                None,
+                                None,
+                            )
+                        )
+
+                yield data.Transaction(
+                    meta,
+                    date,
+                    flags.FLAG_OKAY,
+                    payee,
+                    description,
+                    data.EMPTY_SET,
+                    data.EMPTY_SET,
+                    postings,
                 )
 
-                self._line_index += 1
+                self._line_index += line_count
 
             def balance_assertion(transaction, opening=False, closing=False):
                 lineno = transaction[0]
@@ -285,10 +459,18 @@ class ECImporter(Importer):
                     balance -= _format_number_de(line["Betrag"])
                     balancedate = self._date_from
 
+                    if min_date and min_date > balancedate:
+                        balancedate = min_date
+
                 if closing:
                     # balance after the last transaction:
                     # next day's opening balance
-                    balancedate = self._date_to + timedelta(days=1)
+                    balancedate = self._date_to
+
+                    if max_date and max_date < balancedate:
+                        balancedate = max_date
+
+                    balancedate += timedelta(days=1)
 
                 return [
                     data.Balance(
@@ -314,9 +496,7 @@ class ECImporter(Importer):
                 opening_transaction = last_transaction
 
             if opening_transaction:
-                entries.extend(balance_assertion(opening_transaction, opening=True))
+                yield from balance_assertion(opening_transaction, opening=True)
 
             if closing_transaction:
-                entries.extend(balance_assertion(closing_transaction, closing=True))
-
-        return entries
+                yield from balance_assertion(closing_transaction, closing=True)
@@ -0,0 +1,281 @@
+import codecs
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+import csv
+import gzip
+import hashlib
+import io
+import locale
+import os
+from typing import Dict, List, NamedTuple, Optional
+import warnings
+import zipfile
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# errors raised when reading truncated or corrupt (compressed) files
+READ_ERRORS = (OSError, EOFError, zipfile.BadZipFile) + (
+    (zstandard.ZstdError,) if zstandard else ()
+)
+
+BANKS = ("ING", "ING-DiBa")
+
+FIRST_HEADER = "Umsatzanzeige;Datei erstellt am"
+
+SECOND_HEADER = ";Letztes Update: aktuell"
+
+META_KEYS = ("IBAN", "Kontoname", "Bank", "Kunde", "Zeitraum", "Saldo")
+
+PRE_HEADER = (
+    "In der CSV-Datei finden Sie alle bereits gebuchten Umsätze. "
+    "Die vorgemerkten Umsätze werden nicht aufgenommen, auch wenn sie in "
+    "Ihrem Internetbanking angezeigt werden."
+)
+
+AUTO_ENCODING = "auto"
+
+# enough to cover the header lines, which always contain non-ASCII characters
+SNIFF_SIZE = 4096
+
+# number of files whose preamble is kept in memory
+PREAMBLE_CACHE_SIZE = 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+class InvalidFormatError(Exception):
+    pass
+
+
+class Preamble(NamedTuple):
+    # The header lines of an export: "Umsatzanzeige", an optional second
+    # header line, an empty line, one line for each of META_KEYS (in any
+    # order), an empty line, an optional "Sortierung" line followed by an empty
+    # line, PRE_HEADER and another empty line
+    meta: Dict[str, List[str]]
+    sorting: Optional[str]
+    sorting_lineno: Optional[int]
+    line_count: int
+    encoding: str
+    # number of (decompressed) bytes up to the column names
+    size: int
+
+
+# preambles of the files read last, see open_export
+_preambles: "OrderedDict[tuple, Optional[Preamble]]" = OrderedDict()
+
+
+def _zip_member(filepath: str, archive: zipfile.ZipFile) -> str:
+    names = [info.filename for info in archive.infolist() if not info.is_dir()]
+    csv_names = [name for name in names if name.lower().endswith(".csv")]
+
+    if len(csv_names) > 1:
+        # picking one of them would silently drop the transactions of the others
+        warnings.warn(
+            f"{filepath}: archive contains {len(csv_names)} CSV files, "
+            "only archives with a single export are supported"
+        )
+        raise InvalidFormatError()
+
+    if csv_names:
+        return csv_names[0]
+
+    if len(names) == 1:
+        return names[0]
+
+    raise InvalidFormatError()
+
+
+def _detect_encoding(prefix: bytes) -> str:
+    if prefix.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+
+    try:
+        # the prefix may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(prefix, final=False)
+    except UnicodeDecodeError:
+        return "ISO-8859-1"
+
+    return "utf-8"
+
+
+def _decompress(filepath: str, stream, stack: ExitStack):
+    # Wraps plain, gzip, zstd or zip (single CSV member) files; compressed files
+    # are decoded on the fly and never inflated completely
+    magic = stream.peek(4)[:4]
+
+    if magic.startswith(GZIP_MAGIC):
+        return stack.enter_context(gzip.GzipFile(fileobj=stream))
+
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise InvalidFormatError()
+
+        return stack.enter_context(zstandard.ZstdDecompressor().stream_reader(stream))
+
+    if magic == ZIP_MAGIC:
+        archive = stack.enter_context(zipfile.ZipFile(stream))
+
+        return stack.enter_context(archive.open(_zip_member(filepath, archive)))
+
+    return stream
+
+
+def _buffered(stream, stack: ExitStack):
+    if hasattr(stream, "peek"):
+        return stream
+
+    return stack.enter_context(io.BufferedReader(stream))
+
+
+def parse_preamble(stream, encoding: str) -> Optional[Preamble]:
+    # Reads everything up to the column names from the binary `stream`, one
+    # line at a time, returns None if it does not start with the preamble of
+    # an export
+    line_count = size = 0
+
+    def _read_line():
+        nonlocal line_count, size
+        line_count += 1
+
+        # header lines are short, anything longer is not an export
+        line = stream.readline(SNIFF_SIZE)
+        size += len(line)
+
+        return line.decode(encoding).strip()
+
+    # Header - first line
+    if not _read_line().startswith(FIRST_HEADER):
+        return None
+
+    # Header - second line (optional)
+    line = _read_line()
+
+    if line:
+        if line != SECOND_HEADER:
+            return None
+
+        # Empty line
+        line = _read_line()
+
+    if line:
+        return None
+
+    # Meta
+    lines = [_read_line() for _ in META_KEYS]
+
+    reader = csv.reader(lines, delimiter=";", quoting=csv.QUOTE_MINIMAL, quotechar='"')
+
+    meta = {}
+
+    for row in reader:
+        if not row:
+            return None
+
+        key, *values = row
+
+        if key not in META_KEYS or key in meta:
+            return None
+
+        meta[key] = values
+
+    # Empty line
+    if _read_line():
+        return None
+
+    # Pre-header line (or optional sorting line)
+    line = _read_line()
+
+    sorting = sorting_lineno = None
+
+    if line.startswith("Sortierung"):
+        sorting = line
+        sorting_lineno = line_count
+
+        # Empty line
+        if _read_line():
+            return None
+
+        line = _read_line()
+
+    if line != PRE_HEADER:
+        return None
+
+    # Empty line
+    if _read_line():
+        return None
+
+    return Preamble(meta, sorting, sorting_lineno, line_count, encoding, size)
+
+
+def _cache(key: tuple, preamble: Optional[Preamble]):
+    _preambles[key] = preamble
+
+    if len(_preambles) > PREAMBLE_CACHE_SIZE:
+        _preambles.popitem(last=False)
+
+
+@contextmanager
+def open_export(filepath: str, encoding: Optional[str], body: bool = True):
+    # Opens `filepath` once and yields its preamble together with a text stream
+    # starting at the column names (None unless `body` is set), or (None, None)
+    # if it is not an export.
+    #
+    # The preamble is parsed once for as long as the file does not change, no
+    # matter how many importers look at it; afterwards its bytes are skipped
+    # without decoding them again. Besides mtime and size, the cache key
+    # contains a hash of the first SNIFF_SIZE bytes, which hold the preamble
+    # (or the start of the compressed stream it is decoded from), so that files
+    # rewritten within the mtime granularity keeping their size are parsed
+    # again. The bytes are hashed through the same handle that is read from.
+    with ExitStack() as stack:
+        stream = stack.enter_context(open(filepath, "rb"))
+        stat = os.fstat(stream.fileno())
+        digest = hashlib.blake2b(
+            stream.peek(SNIFF_SIZE)[:SNIFF_SIZE], digest_size=16
+        ).digest()
+
+        key = (filepath, stat.st_mtime_ns, stat.st_size, digest, encoding)
+
+        if key in _preambles:
+            _preambles.move_to_end(key)
+            preamble = _preambles[key]
+
+            if preamble is not None and body:
+                stream = _buffered(_decompress(filepath, stream, stack), stack)
+                stream.read(preamble.size)
+        else:
+            try:
+                stream = _buffered(_decompress(filepath, stream, stack), stack)
+
+                if encoding == AUTO_ENCODING:
+                    # sniffed from the first decompressed bytes without
+                    # consuming them
+                    encoding = _detect_encoding(stream.peek(SNIFF_SIZE)[:SNIFF_SIZE])
+                elif encoding is None:
+                    encoding = locale.getpreferredencoding(False)
+
+                preamble = parse_preamble(stream, encoding)
+            except (InvalidFormatError, UnicodeDecodeError) + READ_ERRORS:
+                preamble = None
+
+            _cache(key, preamble)
+
+        fd = None
+
+        if preamble is not None and body:
+            fd = stack.enter_context(
+                io.TextIOWrapper(stream, encoding=preamble.encoding)
+            )
+
+        yield preamble, fd
+
+
+def read_preamble(filepath: str, encoding: Optional[str]) -> Optional[Preamble]:
+    with open_export(filepath, encoding, body=False) as (preamble, _):
+        return preamble
@@ -0,0 +1,247 @@
+import csv
+import decimal
+import io
+import os
+from stat import S_ISREG
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import warnings
+
+from beancount import loader
+from beancount.core import data
+from beangulp.extract import DUPLICATE
+from beangulp.importer import Importer
+
+from .formats import READ_ERRORS, InvalidFormatError
+from .writer import write_entries
+
+try:
+    import inotify_simple
+except ImportError:  # pragma: no cover
+    inotify_simple = None
+
+# errors raised by importers on incomplete or otherwise unreadable files
+EXTRACT_ERRORS = (
+    InvalidFormatError,
+    ValueError,
+    decimal.InvalidOperation,
+    csv.Error,
+) + READ_ERRORS
+
+
+def _balance_key(entry: data.Balance):
+    # beancount allows a single balance assertion per account, day and currency
+    return (entry.date, entry.account, entry.amount.currency)
+
+
+class Watcher:
+    def __init__(
+        self,
+        directory: str,
+        importers: Iterable[Importer],
+        ledger: str,
+        interval: float = 1.0,
+    ):
+        self.directory = directory
+        self.importers = list(importers)
+        self.ledger = ledger
+        self.interval = interval
+
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        # signature of the files waiting to be imported, and since when it has
+        # not changed
+        self._pending: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        self._existing: Optional[data.Entries] = None
+        self._balances: Dict[tuple, data.Balance] = {}
+
+    def _load_existing(self) -> data.Entries:
+        if self._existing is None:
+            if os.path.isfile(self.ledger):
+                self._existing, _, _ = loader.load_file(self.ledger)
+            else:
+                self._existing = []
+
+            self._balances = {
+                _balance_key(entry): entry
+                for entry in self._existing
+                if isinstance(entry, data.Balance)
+            }
+
+        return self._existing
+
+    def _list_files(self) -> Dict[str, os.stat_result]:
+        ledger = os.path.abspath(self.ledger)
+        files = {}
+
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or os.path.abspath(entry.path) == ledger:
+                    continue
+
+                try:
+                    files[entry.path] = entry.stat()
+                except FileNotFoundError:
+                    # renamed or removed since the directory was listed
+                    continue
+
+        return files
+
+    def _stat_files(self, paths: Iterable[str]) -> Dict[str, os.stat_result]:
+        ledger = os.path.abspath(self.ledger)
+        files = {}
+
+        for path in paths:
+            if os.path.abspath(path) == ledger:
+                continue
+
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            if S_ISREG(stat.st_mode):
+                files[path] = stat
+
+        return files
+
+    def _changed_files(self, files: Dict[str, os.stat_result]) -> List[str]:
+        # Returns the files which changed since they were imported, once they
+        # stayed the same for at least `interval` seconds (i.e. they are no
+        # longer being written)
+        now = time.monotonic()
+        changed = []
+
+        for path in list(self._pending):
+            if path not in files:
+                del self._pending[path]
+
+        for path, stat in files.items():
+            signature = (stat.st_mtime_ns, stat.st_size)
+
+            if self._signatures.get(path) == signature:
+                continue
+
+            pending = self._pending.get(path)
+
+            if pending is None or pending[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - pending[1] >= self.interval:
+                del self._pending[path]
+                self._signatures[path] = signature
+                changed.append(path)
+
+        return sorted(changed)
+
+    def _is_new_balance(self, entry: data.Directive) -> bool:
+        # Returns False for balance assertions already in the ledger. The
+        # ledger is only ever appended to, so an assertion whose amount changed
+        # (e.g. in a re-downloaded export) can not replace the existing one and
+        # is skipped as well.
+        if not isinstance(entry, data.Balance):
+            return True
+
+        key = _balance_key(entry)
+        existing = self._balances.get(key)
+
+        if existing is None:
+            self._balances[key] = entry
+            return True
+
+        if existing.amount != entry.amount:
+            warnings.warn(
+                f"{entry.meta['filename']}:{entry.meta['lineno']}: skipping "
+                f"balance of {entry.amount} for {entry.account} on {entry.date}, "
+                f"{existing.amount} was imported already"
+            )
+
+        return False
+
+    def _extract(self, filepath: str) -> data.Entries:
+        existing = self._load_existing()
+
+        for importer in self.importers:
+            try:
+                if not importer.identify(filepath):
+                    continue
+
+                entries = importer.extract(filepath, existing)
+            except EXTRACT_ERRORS as e:
+                # most likely a file that is still being written; it is
+                # picked up again as soon as it changes
+                warnings.warn(f"{filepath}: {e!r}")
+                return []
+
+            importer.deduplicate(entries, existing)
+
+            # deduplicate() only looks at transactions
+            entries = [
+                entry
+                for entry in entries
+                if not entry.meta.get(DUPLICATE) and self._is_new_balance(entry)
+            ]
+
+            # later files (and later versions of this one) are deduplicated
+            # against the entries imported now
+            existing.extend(entries)
+
+            return entries
+
+        return []
+
+    def scan(self, paths: Optional[Iterable[str]] = None) -> int:
+        # Imports all new or changed files once and returns the number of
+        # entries appended to the ledger. Only `paths` (and the files still
+        # waiting to be imported) are looked at if given, the whole folder
+        # otherwise.
+        if paths is None:
+            files = self._list_files()
+        else:
+            files = self._stat_files(set(paths) | set(self._pending))
+
+        entries = []
+
+        for filepath in self._changed_files(files):
+            entries.extend(self._extract(filepath))
+
+        if entries:
+            buffer = io.StringIO()
+            write_entries(entries, buffer)
+
+            with open(self.ledger, "a", encoding="utf-8") as fd:
+                fd.write("\n" + buffer.getvalue())
+
+        return len(entries)
+
+    def run(self):
+        self.scan()
+
+        if inotify_simple is None:
+            while True:
+                time.sleep(self.interval)
+                self.scan()
+
+        flags = inotify_simple.flags
+        delay = int(self.interval * 1000)
+
+        with inotify_simple.INotify() as inotify:
+            inotify.add_watch(self.directory, flags.CLOSE_WRITE | flags.MOVED_TO)
+
+            while True:
+                # wait for the first event, then give related events (e.g. a
+                # browser renaming a finished download) time to arrive; files
+                # which are not imported yet are looked at again after
+                # `interval`
+                events = inotify.read(
+                    timeout=delay if self._pending else None, read_delay=delay
+                )
+
+                if any(event.mask & flags.Q_OVERFLOW for event in events):
+                    # events were lost
+                    self.scan()
+                    continue
+
+                self.scan(
+                    os.path.join(self.directory, event.name)
+                    for event in events
+                    if event.name and event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO)
+                )
@@ -0,0 +1,211 @@
+from contextlib import ExitStack
+import heapq
+from itertools import count
+import pickle
+from tempfile import TemporaryFile
+from typing import IO, Iterable, Iterator, List, Tuple
+
+from beancount.core import data
+from beancount.parser import printer
+from beancount.utils.misc_utils import escape_string
+
+
+# number of entries held in memory at once when sorting
+CHUNK_SIZE = 100000
+
+# maximum number of formatted fragments (quoted payees, narrations, dates, ...)
+# kept per run
+CACHE_SIZE = 65536
+
+# metadata which the printer never writes out
+HIDDEN_META = ("filename", "lineno")
+
+Record = Tuple[object, int, int, str]
+
+
+def _is_hidden(meta: data.Meta) -> bool:
+    return all(key in HIDDEN_META or key.startswith("__") for key in meta)
+
+
+class _Formatter:
+    # Formats the entries generated by the importers exactly like
+    # beancount.parser.printer.format_entry, but reuses the fragments repeating
+    # across entries; anything else is handed over to the printer
+
+    def __init__(self):
+        self._cache = {}
+
+    def _fragment(self, key, build):
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = build()
+
+            if len(self._cache) < CACHE_SIZE:
+                self._cache[key] = value
+
+            return value
+
+    def _quoted(self, string: str) -> str:
+        return self._fragment(
+            ("quoted", string), lambda: '"{}"'.format(escape_string(string))
+        )
+
+    def _date(self, date) -> str:
+        return self._fragment(("date", date), date.isoformat)
+
+    def _transaction(self, entry: data.Transaction) -> str:
+        strings = []
+
+        if entry.payee:
+            strings.append(self._quoted(entry.payee))
+
+        if entry.narration:
+            strings.append(self._quoted(entry.narration))
+        elif entry.payee:
+            strings.append('""')
+
+        parts = [self._date(entry.date), " ", entry.flag, " ", " ".join(strings), "\n"]
+
+        # accounts and amounts are aligned within the entry (the numbers to
+        # the right, followed by the currencies), like the printer does
+        postings = entry.postings
+        numbers = [
+            None if posting.units is None else format(posting.units.number, "f")
+            for posting in postings
+        ]
+
+        width_account = max((len(posting.account) for posting in postings), default=1)
+        width_number = max(
+            (len(number) + 1 for number in numbers if number is not None), default=0
+        )
+
+        for posting, number in zip(postings, numbers):
+            if number is None:
+                parts += ["  ", posting.account, "\n"]
+                continue
+
+            parts += [
+                "  ",
+                posting.account.ljust(width_account),
+                "  ",
+                (number + " ").rjust(width_number),
+                posting.units.currency,
+                "\n",
+            ]
+
+        return "".join(parts)
+
+    def _balance(self, entry: data.Balance) -> str:
+        return "{} {}{} {}\n".format(
+            self._date(entry.date),
+            self._fragment(
+                ("balance", entry.account),
+                lambda: "balance {:47} ".format(entry.account),
+            ),
+            format(entry.amount.number, "f"),
+            entry.amount.currency,
+        )
+
+    def __call__(self, entry: data.Directive) -> str:
+        if (
+            isinstance(entry, data.Transaction)
+            and entry.flag
+            and not entry.tags
+            and not entry.links
+            and _is_hidden(entry.meta)
+            and all(
+                posting.cost is None
+                and posting.price is None
+                and posting.flag is None
+                and not posting.meta
+                for posting in entry.postings
+            )
+        ):
+            return self._transaction(entry) + "\n"
+
+        if (
+            isinstance(entry, data.Balance)
+            and entry.tolerance is None
+            and entry.diff_amount is None
+            and _is_hidden(entry.meta)
+        ):
+            return self._balance(entry) + "\n"
+
+        return printer.format_entry(entry) + "\n"
+
+
+def _spill(records: List[Record], stack: ExitStack) -> IO[bytes]:
+    fd = stack.enter_context(TemporaryFile())
+    pickler = pickle.Pickler(fd, pickle.HIGHEST_PROTOCOL)
+
+    for record in records:
+        pickler.dump(record)
+
+    fd.seek(0)
+
+    return fd
+
+
+def _read_run(fd: IO[bytes]) -> Iterator[Record]:
+    unpickler = pickle.Unpickler(fd)
+
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+def write_entries(
+    entries: Iterable[data.Directive],
+    fd: IO[str],
+    sort: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    # Writes entries to `fd` as they come in, without building the complete
+    # list first. With `sort`, entries are ordered by date (as beancount does)
+    # using sorted runs of `chunk_size` entries that are merged at the end.
+    format_entry = _Formatter()
+    written = 0
+
+    if not sort:
+        for entry in entries:
+            fd.write(format_entry(entry))
+            written += 1
+
+        return written
+
+    sequence = count()
+    chunk: List[Record] = []
+
+    with ExitStack() as stack:
+        runs = []
+
+        for entry in entries:
+            chunk.append(
+                (
+                    entry.date,
+                    data.SORT_ORDER.get(type(entry), 0),
+                    next(sequence),
+                    format_entry(entry),
+                )
+            )
+
+            if len(chunk) >= chunk_size:
+                chunk.sort()
+                runs.append(_spill(chunk, stack))
+                chunk = []
+
+        chunk.sort()
+
+        if runs:
+            records = heapq.merge(*(_read_run(run) for run in runs), chunk)
+        else:
+            records = chunk
+
+        for *_, text in records:
+            fd.write(text)
+            written += 1
+
+    return written
@@ -0,0 +1,224 @@
+from datetime import date
+from decimal import Decimal
+from unittest import TestCase
+
+from beancount.core import data, flags
+from beancount.core.amount import Amount
+from beancount_ing.categorize import Categorizer, Rule
+
+
+def _row(payee="", booking_text="", description="", category=""):
+    return {
+        "Auftraggeber/Empfänger": payee,
+        "Buchungstext": booking_text,
+        "Verwendungszweck": description,
+        "Kategorie": category,
+    }
+
+
+def _transaction(payee, *accounts):
+    amount = Amount(Decimal("10.00"), "EUR")
+
+    return data.Transaction(
+        data.new_metadata("ledger.beancount", 1),
+        date(2018, 6, 8),
+        flags.FLAG_OKAY,
+        payee,
+        "",
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [data.Posting(account, amount, None, None, None, None) for account in accounts],
+    )
+
+
+class CategorizerTestCase(TestCase):
+    def test_keyword_in_any_field(self):
+        categorizer = Categorizer(
+            [
+                Rule("rewe", "Expenses:Groceries"),
+                Rule("Miete", "Expenses:Rent"),
+            ]
+        )
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="REWE Filialen Voll")),
+            "Expenses:Groceries",
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(description="Miete Juni")),
+            "Expenses:Rent",
+        )
+        self.assertIsNone(categorizer.categorize(_row(payee="LIDL")))
+
+    def test_keyword_restricted_to_field(self):
+        categorizer = Categorizer(
+            [Rule("Gutschrift", "Income:Misc", field="booking_text")]
+        )
+
+        self.assertIsNone(categorizer.categorize(_row(description="Gutschrift")))
+        self.assertEqual(
+            categorizer.categorize(_row(booking_text="Gutschrift")), "Income:Misc"
+        )
+
+    def test_fields_are_checked_in_order(self):
+        categorizer = Categorizer(
+            [
+                Rule("Lastschrift", "Expenses:Misc"),
+                Rule("LIDL", "Expenses:Groceries"),
+            ]
+        )
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="LIDL", booking_text="Lastschrift")),
+            "Expenses:Groceries",
+        )
+
+    def test_overlapping_keywords(self):
+        categorizer = Categorizer(
+            [
+                Rule("Bahn", "Expenses:Travel"),
+                Rule("Bahnhof", "Expenses:Food"),
+            ]
+        )
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="Bahnhofsbäckerei")), "Expenses:Food"
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="Deutsche Bahn")), "Expenses:Travel"
+        )
+
+    def test_special_characters_in_keyword(self):
+        categorizer = Categorizer([Rule("a.b (c)", "Expenses:Misc")])
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="xx A.B (C) yy")), "Expenses:Misc"
+        )
+        self.assertIsNone(categorizer.categorize(_row(payee="axb (c)")))
+
+    def test_many_rules(self):
+        categorizer = Categorizer(
+            Rule("payee {}".format(index), "Expenses:P{}".format(index))
+            for index in range(10000)
+        )
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="Payee 4711")), "Expenses:P4711"
+        )
+
+    def test_long_keyword(self):
+        keyword = "x" * 5000
+        categorizer = Categorizer([Rule(keyword, "Expenses:Misc")])
+
+        self.assertEqual(
+            categorizer.categorize(_row(description="y" + keyword.upper())),
+            "Expenses:Misc",
+        )
+        self.assertIsNone(categorizer.categorize(_row(description=keyword[1:])))
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            Categorizer([Rule("rewe", "Expenses:Groceries", field="Betrag")])
+
+    def test_learn_from_existing_entries(self):
+        categorizer = Categorizer([Rule("rewe", "Expenses:Groceries")])
+
+        categorizer.learn(
+            [
+                _transaction("LIDL", "Assets:ING:Extra", "Expenses:Food"),
+                _transaction("Vermieter", "Expenses:Rent", "Assets:ING:Extra"),
+                _transaction("Other", "Assets:Other", "Expenses:Misc"),
+                _transaction("REWE", "Assets:ING:Extra", "Expenses:Other"),
+            ],
+            "Assets:ING:Extra",
+        )
+
+        account = "Assets:ING:Extra"
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="LIDL"), account), "Expenses:Food"
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="Vermieter"), account), "Expenses:Rent"
+        )
+        self.assertIsNone(categorizer.categorize(_row(payee="Other"), account))
+        # rules take precedence over history
+        self.assertEqual(
+            categorizer.categorize(_row(payee="REWE"), account), "Expenses:Groceries"
+        )
+
+    def test_learn_per_account(self):
+        categorizer = Categorizer()
+        entries = [
+            _transaction("LIDL", "Assets:ING:Extra", "Expenses:Food"),
+            _transaction("LIDL", "Assets:ING:Giro", "Expenses:Groceries"),
+        ]
+
+        categorizer.learn(entries, "Assets:ING:Extra")
+        categorizer.learn(entries, "Assets:ING:Giro")
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="LIDL"), "Assets:ING:Extra"),
+            "Expenses:Food",
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="LIDL"), "Assets:ING:Giro"),
+            "Expenses:Groceries",
+        )
+        self.assertIsNone(categorizer.categorize(_row(payee="LIDL")))
+
+    def test_learn_skips_conflicting_payees(self):
+        categorizer = Categorizer()
+
+        categorizer.learn(
+            [
+                _transaction("Amazon", "Assets:ING:Extra", "Expenses:Books"),
+                _transaction("Amazon", "Assets:ING:Extra", "Expenses:Household"),
+                _transaction("LIDL", "Assets:ING:Extra", "Expenses:Food"),
+                _transaction("LIDL", "Assets:ING:Extra", "Expenses:Food"),
+            ],
+            "Assets:ING:Extra",
+        )
+
+        self.assertIsNone(
+            categorizer.categorize(_row(payee="Amazon"), "Assets:ING:Extra")
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="LIDL"), "Assets:ING:Extra"),
+            "Expenses:Food",
+        )
+
+    def test_learn_replaces_previous_history(self):
+        categorizer = Categorizer()
+
+        categorizer.learn(
+            [_transaction("LIDL", "Assets:ING:Extra", "Expenses:Food")],
+            "Assets:ING:Extra",
+        )
+        categorizer.learn([], "Assets:ING:Extra")
+
+        self.assertIsNone(
+            categorizer.categorize(_row(payee="LIDL"), "Assets:ING:Extra")
+        )
+
+    def test_non_ascii_case(self):
+        categorizer = Categorizer(
+            [
+                Rule("İstanbul", "Expenses:Food"),
+                Rule("kiosk", "Expenses:Snacks"),
+                Rule("STRASSE", "Expenses:Parking"),
+            ]
+        )
+
+        self.assertEqual(
+            categorizer.categorize(_row(payee="İSTANBUL GRILL")), "Expenses:Food"
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="İstanbul Grill")), "Expenses:Food"
+        )
+        self.assertEqual(
+            categorizer.categorize(_row(payee="Parkhaus Straße")), "Expenses:Parking"
+        )
+        # neither of these is a case variant of "kiosk", but they must not fail
+        self.assertIsNone(categorizer.categorize(_row(payee="KİOSK")))
+        self.assertIsNone(categorizer.categorize(_row(payee="kıosk")))
@@ -1,14 +1,22 @@
 import datetime
 from decimal import Decimal
+import gzip
 from tempfile import gettempdir
 from textwrap import dedent
-from unittest import TestCase
+from unittest import TestCase, skipIf
 import os
 from datetime import date
+import zipfile
 
 from beancount.core.data import Balance, Transaction
+from beancount_ing.categorize import Categorizer, Rule
 from beancount_ing.ec import BANKS, ECImporter, PRE_HEADER
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 HEADER = ";".join(
     '"{}"'.format(field)
@@ -561,3 +569,402 @@ class ECImporterTestCase(TestCase):
         self.assertEqual(directives[5].date, date(2018, 7, 1))
         self.assertEqual(directives[5].amount.number, 1000.0)
         self.assertEqual(directives[5].amount.currency, "EUR")
+
+    def test_date_window_ascending_stops_early(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(
+                self._format_data(
+                    """
+                    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+                    IBAN;{formatted_iban}
+                    Kontoname;Extra-Konto
+                    Bank;ING
+                    Kunde;{user}
+                    Zeitraum;01.06.2018 - 30.06.2018
+                    Saldo;5.000,00;EUR
+
+                    Sortierung;Datum aufsteigend
+
+                    {pre_header}
+
+                    "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+                    08.06.2018;08.06.2018;REWE Filialen Voll;Gutschrift;Kategorie;REWE SAGT DANKE;1.234,00;EUR;-500,00;EUR
+                    10.06.2018;10.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+                    15.06.2018;15.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.100,00;EUR;-100,00;EUR
+                    xx.xx.xxxx;this row is never parsed
+                    """  # NOQA
+                )
+            )
+
+        importer = ECImporter(
+            self.iban,
+            "Assets:ING:Extra",
+            self.user,
+            min_date=date(2018, 6, 9),
+            max_date=date(2018, 6, 12),
+        )
+
+        directives = importer.extract(self.filename)
+
+        # 1 transaction + 2 balance assertions
+        self.assertEqual(len(directives), 1 + 2)
+        self.assertEqual(directives[0].date, date(2018, 6, 10))
+        # Test opening balance
+        self.assertEqual(directives[1].date, date(2018, 6, 9))
+        self.assertEqual(directives[1].amount.number, 1234.0)
+        # Test closing balance
+        self.assertEqual(directives[2].date, date(2018, 6, 13))
+        self.assertEqual(directives[2].amount.number, 1200.0)
+
+    def test_date_window_from_existing_entries(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(
+                self._format_data(
+                    """
+                    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+                    IBAN;{formatted_iban}
+                    Kontoname;Extra-Konto
+                    Bank;ING
+                    Kunde;{user}
+                    Zeitraum;01.06.2018 - 30.06.2018
+                    Saldo;5.000,00;EUR
+
+                    Sortierung;Datum absteigend
+
+                    {pre_header}
+
+                    "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+                    15.06.2018;15.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.000,00;EUR;-100,00;EUR
+                    10.06.2018;10.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.100,00;EUR;-100,00;EUR
+                    08.06.2018;08.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+                    """  # NOQA
+                )
+            )
+
+        importer = ECImporter(
+            self.iban, "Assets:ING:Extra", self.user, incremental=True
+        )
+
+        existing = [
+            entry
+            for entry in importer.extract(self.filename)
+            if isinstance(entry, Transaction) and entry.date < date(2018, 6, 11)
+        ]
+
+        directives = importer.extract(self.filename, existing)
+
+        # 2 transactions (on and after 10.06.) + 2 balance assertions
+        self.assertEqual(len(directives), 2 + 2)
+        self.assertEqual(directives[0].date, date(2018, 6, 15))
+        self.assertEqual(directives[1].date, date(2018, 6, 10))
+        # Test opening balance
+        self.assertEqual(directives[2].date, date(2018, 6, 10))
+        self.assertEqual(directives[2].amount.number, 1200.0)
+        # Test closing balance
+        self.assertEqual(directives[3].date, date(2018, 7, 1))
+        self.assertEqual(directives[3].amount.number, 1000.0)
+
+    def test_summarize(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(
+                self._format_data(
+                    """
+                    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+                    IBAN;{formatted_iban}
+                    Kontoname;Extra-Konto
+                    Bank;ING
+                    Kunde;{user}
+                    Zeitraum;01.06.2018 - 30.06.2018
+                    Saldo;5.000,00;EUR
+
+                    Sortierung;Datum aufsteigend
+
+                    {pre_header}
+
+                    "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+                    08.06.2018;08.06.2018;REWE Filialen Voll;Gutschrift;Kategorie;REWE SAGT DANKE;1.234,00;EUR;-500,00;EUR
+                    08.06.2018;08.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+                    15.06.2018;08.06.2018;Arbeitgeber;Gutschrift;Kategorie;Gehalt;2.200,00;EUR;1.000,00;EUR
+                    """  # NOQA
+                )
+            )
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        summary = importer.summarize(self.filename)
+
+        self.assertEqual(summary.account, "Assets:ING:Extra")
+        self.assertEqual(summary.iban, self.iban)
+        self.assertEqual(summary.date_from, date(2018, 6, 1))
+        self.assertEqual(summary.date_to, date(2018, 6, 30))
+        self.assertEqual(summary.rows, 3)
+        self.assertEqual(summary.credits, {"EUR": Decimal("1000.00")})
+        self.assertEqual(summary.debits, {"EUR": Decimal("-534.00")})
+        # balance after the last transaction, not the "Saldo" line
+        self.assertEqual(summary.balance.number, Decimal("2200.00"))
+        self.assertEqual(summary.balance.currency, "EUR")
+
+    def test_summarize_multiple_currencies(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(
+                self._format_data(
+                    """
+                    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+                    IBAN;{formatted_iban}
+                    Kontoname;Extra-Konto
+                    Bank;ING
+                    Kunde;{user}
+                    Zeitraum;01.06.2018 - 30.06.2018
+                    Saldo;5.000,00;EUR
+
+                    {pre_header}
+
+                    "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+                    08.06.2018;08.06.2018;REWE Filialen Voll;Gutschrift;Kategorie;REWE SAGT DANKE;1.234,00;EUR;-500,00;EUR
+                    09.06.2018;09.06.2018;Shop;Lastschrift;Kategorie;Shop;1.200,00;EUR;-34,00;USD
+                    10.06.2018;10.06.2018;Shop;Gutschrift;Kategorie;Shop;1.210,00;EUR;10,00;USD
+                    """  # NOQA
+                )
+            )
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        summary = importer.summarize(self.filename)
+
+        self.assertEqual(summary.rows, 3)
+        self.assertEqual(summary.credits, {"USD": Decimal("10.00")})
+        self.assertEqual(
+            summary.debits, {"EUR": Decimal("-500.00"), "USD": Decimal("-34.00")}
+        )
+        # not sorted by date
+        self.assertIsNone(summary.balance)
+
+    def _sample_data(self):
+        return self._format_data(
+            """
+            Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+            IBAN;{formatted_iban}
+            Kontoname;Extra-Konto
+            Bank;ING
+            Kunde;{user}
+            Zeitraum;01.06.2018 - 30.06.2018
+            Saldo;5.000,00;EUR
+
+            Sortierung;Datum aufsteigend
+
+            {pre_header}
+
+            "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+            08.06.2018;08.06.2018;REWE Filialen Voll;Gutschrift;Kategorie;REWE SAGT DANKE;1.234,00;EUR;-500,00;EUR
+            08.06.2018;08.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+            """  # NOQA
+        )
+
+    def _assert_compressed_file(self, filename):
+        self.addCleanup(os.remove, filename)
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        self.assertTrue(importer.identify(filename))
+
+        directives = importer.extract(filename)
+
+        # 2 transactions + 2 balance assertions
+        self.assertEqual(len(directives), 2 + 2)
+        self.assertEqual(directives[0].payee, "REWE Filialen Voll")
+        self.assertEqual(directives[0].meta["filename"], filename)
+        self.assertEqual(directives[1].payee, "LIDL")
+
+    def test_gzip_file(self):
+        filename = path_for_temp_file("{}.csv.gz".format(self.iban))
+
+        with gzip.open(filename, "wb") as fd:
+            fd.write(self._sample_data())
+
+        self._assert_compressed_file(filename)
+
+    def test_zip_file(self):
+        filename = path_for_temp_file("{}.zip".format(self.iban))
+
+        with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("README.txt", "Umsatzanzeige")
+            archive.writestr("{}.csv".format(self.iban), self._sample_data())
+
+        self._assert_compressed_file(filename)
+
+    def test_zip_file_without_csv(self):
+        filename = path_for_temp_file("{}.zip".format(self.iban))
+        self.addCleanup(os.remove, filename)
+
+        with zipfile.ZipFile(filename, "w") as archive:
+            archive.writestr("a.txt", "")
+            archive.writestr("b.txt", "")
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        self.assertFalse(importer.identify(filename))
+
+    def test_zip_file_with_several_csvs(self):
+        filename = path_for_temp_file("{}.zip".format(self.iban))
+        self.addCleanup(os.remove, filename)
+
+        with zipfile.ZipFile(filename, "w") as archive:
+            archive.writestr("2017.csv", self._sample_data())
+            archive.writestr("2018.csv", self._sample_data())
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        with self.assertWarns(UserWarning):
+            self.assertFalse(importer.identify(filename))
+
+    def test_corrupt_compressed_files(self):
+        with gzip.open(self.filename, "wb") as fd:
+            fd.write(self._sample_data())
+
+        with open(self.filename, "rb") as fd:
+            compressed = fd.read()
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        for content in (
+            # truncated gzip
+            compressed[: len(compressed) // 2],
+            # gzip magic number, but no gzip file
+            b"\x1f\x8b" + self._sample_data(),
+            # zip magic number, but no zip file
+            b"PK\x03\x04" + self._sample_data(),
+        ):
+            with open(self.filename, "wb") as fd:
+                fd.write(content)
+
+            self.assertFalse(importer.identify(self.filename))
+
+    @skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd_file(self):
+        filename = path_for_temp_file("{}.csv.zst".format(self.iban))
+
+        with open(filename, "wb") as fd:
+            fd.write(zstandard.ZstdCompressor().compress(self._sample_data()))
+
+        self._assert_compressed_file(filename)
+
+    def test_categorizer(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(self._sample_data())
+
+        importer = ECImporter(
+            self.iban,
+            "Assets:ING:Extra",
+            self.user,
+            categorizer=Categorizer([Rule("rewe", "Expenses:Groceries")]),
+        )
+
+        directives = importer.extract(self.filename)
+
+        self.assertEqual(len(directives[0].postings), 2)
+        self.assertEqual(directives[0].postings[1].account, "Expenses:Groceries")
+        self.assertEqual(directives[0].postings[1].units.number, Decimal("500.00"))
+        self.assertEqual(directives[0].postings[1].units.currency, "EUR")
+
+        # LIDL is unknown ...
+        self.assertEqual(len(directives[1].postings), 1)
+
+        # ... until it shows up in the existing entries
+        existing = [
+            directives[1]._replace(
+                postings=directives[0].postings[:1]
+                + [directives[0].postings[1]._replace(account="Expenses:Food")]
+            )
+        ]
+
+        directives = importer.extract(self.filename, existing)
+
+        self.assertEqual(directives[1].postings[1].account, "Expenses:Food")
+
+    def test_repeated_values_are_shared(self):
+        with open(self.filename, "wb") as fd:
+            fd.write(
+                self._format_data(
+                    """
+                    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+                    IBAN;{formatted_iban}
+                    Kontoname;Extra-Konto
+                    Bank;ING
+                    Kunde;{user}
+                    Zeitraum;01.06.2018 - 30.06.2018
+                    Saldo;5.000,00;EUR
+
+                    {pre_header}
+
+                    "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+                    08.06.2018;08.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+                    08.06.2018;08.06.2018;LIDL;Lastschrift;Kategorie;LIDL SAGT DANKE;1.166,00;EUR;-34,00;EUR
+                    """  # NOQA
+                )
+            )
+
+        importer = ECImporter(self.iban, "Assets:ING:Extra", self.user)
+
+        first, second = importer.extract(self.filename)
+
+        self.assertEqual(first.payee, "LIDL")
+        self.assertEqual(first.narration, "Lastschrift LIDL SAGT DANKE")
+        self.assertEqual(first.postings[0].units.number, Decimal("-34.00"))
+
+        self.assertIs(first.payee, second.payee)
+        self.assertIs(first.narration, second.narration)
+        self.assertIs(first.date, second.date)
+        self.assertIs(first.postings[0].units, second.postings[0].units)
+        self.assertIs(first.meta["filename"], second.meta["filename"])
+        self.assertNotEqual(first.meta["lineno"], second.meta["lineno"])
+
+        importer = ECImporter(
+            self.iban,
+            "Assets:ING:Extra",
+            self.user,
+            categorizer=Categorizer([Rule("LIDL", "Expenses:Groceries")]),
+        )
+
+        first, second = importer.extract(self.filename)
+
+        self.assertEqual(first.postings[1].units.number, Decimal("34.00"))
+        self.assertIs(first.postings[1].units, second.postings[1].units)
+
+    def test_auto_encoding(self):
+        text = self._sample_data().decode("ISO-8859-1")
+
+        importer = ECImporter(
+            self.iban, "Assets:ING:Extra", self.user, file_encoding="auto"
+        )
+
+        for encoding in ("ISO-8859-1", "utf-8", "utf-8-sig"):
+            with open(self.filename, "wb") as fd:
+                fd.write(text.encode(encoding))
+
+            self.assertTrue(importer.identify(self.filename))
+
+            directives = importer.extract(self.filename)
+
+            self.assertEqual(len(directives), 2 + 2)
+            self.assertEqual(directives[0].payee, "REWE Filialen Voll")
+
+    def test_auto_encoding_compressed(self):
+        filename = path_for_temp_file("{}.csv.gz".format(self.iban))
+
+        with gzip.open(filename, "wb") as fd:
+            fd.write(self._sample_data().decode("ISO-8859-1").encode("utf-8"))
+
+        self.addCleanup(os.remove, filename)
+
+        importer = ECImporter(
+            self.iban, "Assets:ING:Extra", self.user, file_encoding="auto"
+        )
+
+        self.assertTrue(importer.identify(filename))
+        self.assertEqual(len(importer.extract(filename)), 2 + 2)
@@ -0,0 +1,194 @@
+import csv
+from decimal import Decimal
+import io
+import os
+import random
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+import time
+from unittest import TestCase
+
+from beancount.core.data import Transaction
+from beancount_ing.ec import ECImporter, PRE_HEADER
+from beancount_ing.formats import InvalidFormatError
+
+
+PREAMBLE = dedent(
+    """
+    Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+    IBAN;DE99 9999 9999 9999 9999 99
+    Kontoname;Extra-Konto
+    Bank;ING
+    Kunde;Max Mustermann
+    Zeitraum;01.06.2018 - 30.06.2018
+    Saldo;5.000,00;EUR
+
+    {pre_header}
+
+    """
+).format(pre_header=PRE_HEADER)
+
+FIELDS = (
+    "Buchung",
+    "Valuta",
+    "Auftraggeber/Empfänger",
+    "Buchungstext",
+    "Verwendungszweck",
+    "Saldo",
+    "Währung",
+    "Betrag",
+    "Währung",
+)
+
+ALPHABET = 'abcXYZ äöüß 0123;;""\n\n'
+
+
+def _row(payee, description):
+    return (
+        "08.06.2018",
+        "08.06.2018",
+        payee,
+        "Lastschrift",
+        description,
+        "1.234,00",
+        "EUR",
+        "-1,00",
+        "EUR",
+    )
+
+
+class PathologicalRowsTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+
+        self.filename = os.path.join(tempdir.name, "umsatz.csv")
+        self.importer = ECImporter(
+            "DE99999999999999999999", "Assets:ING:Extra", "Max Mustermann"
+        )
+
+    def _write(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=";", lineterminator="\n")
+        writer.writerow(FIELDS)
+        writer.writerows(rows)
+
+        with open(self.filename, "w", encoding="ISO-8859-1", newline="") as fd:
+            fd.write(PREAMBLE.lstrip() + buffer.getvalue())
+
+    def _transactions(self):
+        return [
+            entry
+            for entry in self.importer.extract(self.filename)
+            if isinstance(entry, Transaction)
+        ]
+
+    def test_quoted_newlines(self):
+        self._write(
+            [
+                _row("REWE", "REWE SAGT DANKE\nFiliale 123\n"),
+                _row('"LIDL";', 'LIDL "SAGT"; DANKE'),
+            ]
+        )
+
+        first, second = self._transactions()
+
+        self.assertEqual(first.narration, "Lastschrift REWE SAGT DANKE\nFiliale 123")
+        self.assertEqual(second.payee, '"LIDL";')
+        self.assertEqual(second.narration, 'Lastschrift LIDL "SAGT"; DANKE')
+
+        # the first record spans three lines
+        self.assertEqual(second.meta["lineno"], first.meta["lineno"] + 3)
+        self.assertTrue(
+            first.meta["__source__"].endswith('Filiale 123\n";1.234,00;EUR;-1,00;EUR')
+        )
+        self.assertTrue(
+            second.meta["__source__"].startswith('08.06.2018;08.06.2018;"""LIDL"";"')
+        )
+
+    def test_huge_field(self):
+        description = "x" * (1024 * 1024)
+
+        self._write([_row("REWE", description), _row("LIDL", "")])
+
+        first, second = self._transactions()
+
+        self.assertEqual(first.narration, "Lastschrift " + description)
+        self.assertEqual(second.payee, "LIDL")
+
+    def test_truncated_row(self):
+        self._write([_row("REWE", ""), _row("LIDL", "")[:4]])
+
+        with self.assertRaises(InvalidFormatError):
+            self._transactions()
+
+        with self.assertRaises(InvalidFormatError):
+            self.importer.summarize(self.filename)
+
+    def test_summarize_quoted_newlines(self):
+        self._write(
+            [
+                _row("REWE", "REWE SAGT DANKE\nFiliale 123\n"),
+                _row("LIDL", ""),
+            ]
+        )
+
+        summary = self.importer.summarize(self.filename)
+
+        self.assertEqual(summary.rows, 2)
+        self.assertEqual(summary.debits, {"EUR": Decimal("-2.00")})
+
+    def test_fuzz(self):
+        rng = random.Random(4711)
+
+        def _text(length):
+            return "".join(rng.choice(ALPHABET) for _ in range(length)).strip()
+
+        for _ in range(20):
+            rows = [
+                _row(_text(rng.randint(1, 20)), _text(rng.randint(0, 200)))
+                for _ in range(rng.randint(1, 50))
+            ]
+
+            self._write(rows)
+
+            transactions = self._transactions()
+
+            self.assertEqual(len(transactions), len(rows))
+
+            for transaction, row in zip(transactions, rows):
+                self.assertEqual(transaction.payee, row[2])
+                self.assertEqual(
+                    transaction.narration, "{} {}".format(row[3], row[4]).strip()
+                )
+
+    def _duration(self, rows):
+        self._write(rows)
+
+        durations = []
+
+        for _ in range(3):
+            start = time.perf_counter()
+            self.importer.extract(self.filename)
+            durations.append(time.perf_counter() - start)
+
+        return min(durations)
+
+    def test_linear_time(self):
+        # ~3 KB of quotes, semicolons and newlines per field
+        adversarial = '"";\n' * 750
+
+        small = self._duration([_row("REWE", adversarial)] * 200)
+        large = self._duration([_row("REWE", adversarial)] * 800)
+
+        # 4x the input should take about 4x the time, not 16x
+        self.assertLess(large / small, 8)
+
+        # and stay within the same order of magnitude as a plain file of the
+        # same size (which has a lot fewer lines)
+        plain = self._duration([_row("REWE", "x" * len(adversarial))] * 800)
+
+        self.assertLess(large / plain, 20)
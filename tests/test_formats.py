@@ -0,0 +1,173 @@
+import gzip
+import os
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from unittest import TestCase, mock
+
+from beancount_ing.ec import ECImporter
+from beancount_ing import formats
+from beancount_ing.formats import PRE_HEADER, read_preamble
+
+
+class FormatsTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+
+        self.directory = tempdir.name
+
+    def _write(self, name, content):
+        filepath = os.path.join(self.directory, name)
+
+        with open(filepath, "wb") as fd:
+            fd.write(dedent(content).lstrip().encode("ISO-8859-1"))
+
+        return filepath
+
+    def _write_umsatzanzeige(self, name, iban):
+        return self._write(
+            name,
+            """
+            Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+            ;Letztes Update: aktuell
+
+            IBAN;{iban}
+            Kontoname;Extra-Konto
+            Bank;ING
+            Kunde;Max Mustermann
+            Zeitraum;01.06.2018 - 30.06.2018
+            Saldo;5.000,00;EUR
+
+            Sortierung;Datum absteigend
+
+            {pre_header}
+
+            "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+            08.06.2018;08.06.2018;LIDL;Lastschrift;LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR
+            """.format(iban=iban, pre_header=PRE_HEADER),  # NOQA
+        )
+
+    def test_not_an_export(self):
+        filepath = self._write("notes.txt", "nothing to see here")
+
+        self.assertIsNone(read_preamble(filepath, "ISO-8859-1"))
+
+    def test_preamble(self):
+        filepath = self._write_umsatzanzeige(
+            "umsatz.csv", "DE99 9999 9999 9999 9999 99"
+        )
+
+        preamble = read_preamble(filepath, "ISO-8859-1")
+
+        self.assertEqual(preamble.meta["Kunde"], ["Max Mustermann"])
+        self.assertEqual(preamble.meta["Saldo"], ["5.000,00", "EUR"])
+        self.assertEqual(preamble.sorting, "Sortierung;Datum absteigend")
+        self.assertEqual(preamble.sorting_lineno, 11)
+        self.assertEqual(preamble.line_count, 14)
+
+    def test_preamble_parsed_once_for_all_importers(self):
+        first = self._write_umsatzanzeige("first.csv", "DE11 1111 1111 1111 1111 11")
+        second = self._write_umsatzanzeige("second.csv", "DE22 2222 2222 2222 2222 22")
+
+        importers = [
+            ECImporter("DE11111111111111111111", "Assets:ING:First", "Max Mustermann"),
+            ECImporter("DE22222222222222222222", "Assets:ING:Second", "Max Mustermann"),
+        ]
+
+        self.assertEqual(
+            [importer.identify(first) for importer in importers], [True, False]
+        )
+        self.assertEqual(
+            [importer.identify(second) for importer in importers], [False, True]
+        )
+
+        self.assertIs(
+            read_preamble(first, "ISO-8859-1"), read_preamble(first, "ISO-8859-1")
+        )
+
+        # changing the file invalidates the cached preamble
+        preamble = read_preamble(first, "ISO-8859-1")
+        self._write_umsatzanzeige("first.csv", "DE33333333333333333333")
+
+        self.assertIsNot(read_preamble(first, "ISO-8859-1"), preamble)
+        self.assertFalse(importers[0].identify(first))
+
+    def test_file_opened_and_decoded_once_per_call(self):
+        plain = self._write_umsatzanzeige("umsatz.csv", "DE11 1111 1111 1111 1111 11")
+
+        with open(plain, "rb") as fd:
+            content = fd.read()
+
+        compressed = os.path.join(self.directory, "umsatz.csv.gz")
+
+        with gzip.open(compressed, "wb") as fd:
+            fd.write(content)
+
+        for filepath in (plain, compressed):
+            importers = [
+                ECImporter(
+                    "DE22222222222222222222",
+                    "Assets:ING:Second",
+                    "Max Mustermann",
+                    file_encoding="auto",
+                ),
+                ECImporter(
+                    "DE11111111111111111111",
+                    "Assets:ING:First",
+                    "Max Mustermann",
+                    file_encoding="auto",
+                ),
+            ]
+
+            with (
+                mock.patch.object(formats, "open", wraps=open, create=True) as opened,
+                mock.patch.object(
+                    formats, "parse_preamble", wraps=formats.parse_preamble
+                ) as parsed,
+            ):
+                self.assertEqual(
+                    [importer.identify(filepath) for importer in importers],
+                    [False, True],
+                )
+                entry, *_ = importers[1].extract(filepath)
+
+            self.assertEqual(entry.payee, "LIDL")
+            self.assertEqual(entry.meta["lineno"], 16)
+
+            # once for each call, the preamble is only decoded the first time
+            self.assertEqual(opened.call_count, len(importers) + 1)
+            self.assertEqual(parsed.call_count, 1)
+
+    def test_preamble_cache_checks_content(self):
+        filepath = self._write_umsatzanzeige(
+            "umsatz.csv", "DE11 1111 1111 1111 1111 11"
+        )
+        stat = os.stat(filepath)
+
+        preamble = read_preamble(filepath, "ISO-8859-1")
+
+        # same size and modification time, different IBAN
+        self._write_umsatzanzeige("umsatz.csv", "DE22 2222 2222 2222 2222 22")
+        os.utime(filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        self.assertEqual(os.stat(filepath).st_size, stat.st_size)
+        self.assertEqual(preamble.meta["IBAN"], ["DE11 1111 1111 1111 1111 11"])
+        self.assertEqual(
+            read_preamble(filepath, "ISO-8859-1").meta["IBAN"],
+            ["DE22 2222 2222 2222 2222 22"],
+        )
+
+    def test_unknown_meta_keys(self):
+        filepath = self._write_umsatzanzeige(
+            "umsatz.csv", "DE99 9999 9999 9999 9999 99"
+        )
+
+        with open(filepath, "rb") as fd:
+            content = fd.read()
+
+        with open(filepath, "wb") as fd:
+            fd.write(content.replace(b"Kontoname;", b"Depot;"))
+
+        self.assertIsNone(read_preamble(filepath, "ISO-8859-1"))
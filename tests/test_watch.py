@@ -0,0 +1,230 @@
+import os
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from unittest import TestCase, mock
+
+from beancount import loader
+from beancount.core import amount
+from beancount.core.data import Balance, Transaction
+from beancount_ing.ec import ECImporter, PRE_HEADER
+from beancount_ing.watch import Watcher
+
+
+ROWS = (
+    "08.06.2018;08.06.2018;REWE Filialen Voll;Lastschrift;Kategorie;"
+    "REWE SAGT DANKE;1.234,00;EUR;-500,00;EUR",
+    "10.06.2018;10.06.2018;LIDL;Lastschrift;Kategorie;"
+    "LIDL SAGT DANKE;1.200,00;EUR;-34,00;EUR",
+)
+
+
+class _ScandirIterator(list):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class WatcherTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.iban = "DE99999999999999999999"
+        self.user = "Max Mustermann"
+
+        tempdir = TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+
+        self.directory = tempdir.name
+        self.ledger = os.path.join(self.directory, "ledger.beancount")
+
+        self.watcher = Watcher(
+            self.directory,
+            [ECImporter(self.iban, "Assets:ING:Extra", self.user)],
+            self.ledger,
+            interval=0,
+        )
+
+    def _scan(self, watcher=None):
+        # files are only imported once they were seen unchanged by two scans
+        watcher = watcher or self.watcher
+
+        self.assertEqual(watcher.scan(), 0)
+
+        return watcher.scan()
+
+    def _write_export(self, name, rows):
+        content = dedent(
+            """
+            Umsatzanzeige;Datei erstellt am: 25.07.2018 12:00
+
+            IBAN;DE99 9999 9999 9999 9999 99
+            Kontoname;Extra-Konto
+            Bank;ING
+            Kunde;{user}
+            Zeitraum;01.06.2018 - 30.06.2018
+            Saldo;5.000,00;EUR
+
+            Sortierung;Datum aufsteigend
+
+            {pre_header}
+
+            "Buchung";"Valuta";"Auftraggeber/Empfänger";"Buchungstext";"Kategorie";"Verwendungszweck";"Saldo";"Währung";"Betrag";"Währung"
+            """  # NOQA
+        ).format(user=self.user, pre_header=PRE_HEADER)
+
+        with open(os.path.join(self.directory, name), "wb") as fd:
+            fd.write((content.lstrip() + "\n".join(rows)).encode("ISO-8859-1"))
+
+        return os.path.join(self.directory, name)
+
+    def _ledger_entries(self):
+        entries, _, _ = loader.load_file(self.ledger)
+
+        return entries
+
+    def _duplicate_balance_errors(self):
+        _, errors, _ = loader.load_file(self.ledger)
+
+        return [error for error in errors if "Duplicate balance" in error.message]
+
+    def test_new_files_are_appended(self):
+        self._write_export("umsatz.csv", ROWS[:1])
+
+        self.assertEqual(self._scan(), 1 + 2)
+        # nothing changed
+        self.assertEqual(self.watcher.scan(), 0)
+
+        entries = self._ledger_entries()
+
+        self.assertEqual(len(entries), 1 + 2)
+        self.assertEqual(
+            [entry.payee for entry in entries if isinstance(entry, Transaction)],
+            ["REWE Filialen Voll"],
+        )
+
+    def test_changed_files_are_deduplicated(self):
+        self._write_export("umsatz.csv", ROWS[:1])
+        self._scan()
+
+        self._write_export("umsatz.csv", ROWS)
+
+        # only the LIDL transaction, the closing balance of the same day was
+        # imported already
+        with self.assertWarns(UserWarning):
+            self.assertEqual(self._scan(), 1)
+
+        self.assertEqual(self._duplicate_balance_errors(), [])
+
+        entries = self._ledger_entries()
+
+        self.assertEqual(
+            sorted(entry.payee for entry in entries if isinstance(entry, Transaction)),
+            ["LIDL", "REWE Filialen Voll"],
+        )
+        self.assertEqual(
+            len([entry for entry in entries if isinstance(entry, Balance)]), 2
+        )
+
+    def test_repeated_balances_are_skipped(self):
+        self._write_export("first.csv", ROWS)
+        self._write_export("second.csv", ROWS)
+
+        # the second file only repeats the entries of the first one
+        self.assertEqual(self._scan(), 2 + 2)
+
+        self.assertEqual(self._duplicate_balance_errors(), [])
+
+    def test_existing_ledger_is_respected(self):
+        self._write_export("umsatz.csv", ROWS)
+        self._scan()
+
+        watcher = Watcher(
+            self.directory,
+            [ECImporter(self.iban, "Assets:ING:Extra", self.user)],
+            self.ledger,
+            interval=0,
+        )
+
+        self.assertEqual(self._scan(watcher), 0)
+
+    def test_incomplete_files_are_retried(self):
+        self._write_export("umsatz.csv", [ROWS[0], ROWS[1][:20]])
+
+        with self.assertWarns(UserWarning):
+            self.assertEqual(self._scan(), 0)
+
+        self._write_export("umsatz.csv", ROWS)
+
+        self.assertEqual(self._scan(), 2 + 2)
+
+    def test_files_being_written_are_not_imported(self):
+        # cut off within the last field
+        filepath = self._write_export("umsatz.csv", [ROWS[0], ROWS[1][:-2]])
+
+        self.assertEqual(self.watcher.scan(), 0)
+
+        with open(filepath, "ab") as fd:
+            fd.write(ROWS[1][-2:].encode("ISO-8859-1"))
+
+        self.assertEqual(self.watcher.scan(), 0)
+        self.assertEqual(self.watcher.scan(), 2 + 2)
+
+        entries = self._ledger_entries()
+
+        self.assertEqual(
+            [
+                posting.units
+                for entry in entries
+                if isinstance(entry, Transaction)
+                for posting in entry.postings
+            ],
+            [amount.A("-500.00 EUR"), amount.A("-34.00 EUR")],
+        )
+
+    def test_files_are_imported_after_interval(self):
+        watcher = Watcher(
+            self.directory,
+            [ECImporter(self.iban, "Assets:ING:Extra", self.user)],
+            self.ledger,
+            interval=60,
+        )
+
+        self._write_export("umsatz.csv", ROWS)
+
+        self.assertEqual(watcher.scan(), 0)
+        self.assertEqual(watcher.scan(), 0)
+
+    def test_scan_given_paths(self):
+        first = self._write_export("first.csv", ROWS[:1])
+        self._write_export("second.csv", ROWS[1:])
+
+        self.assertEqual(self.watcher.scan([first, self.ledger]), 0)
+        # files waiting to be imported are looked at again
+        self.assertEqual(self.watcher.scan([]), 1 + 2)
+
+    def test_removed_files_are_skipped(self):
+        self._write_export("first.csv", ROWS)
+        self._write_export("second.csv", ROWS)
+
+        scandir = os.scandir
+
+        def _scandir(path):
+            # the second export disappears right after the directory is listed
+            entries = list(scandir(path))
+            os.remove(os.path.join(self.directory, "second.csv"))
+
+            return _ScandirIterator(entries)
+
+        with mock.patch.object(os, "scandir", _scandir):
+            self.assertEqual(self.watcher.scan(), 0)
+
+        self.assertEqual(self.watcher.scan(), 2 + 2)
+
+    def test_unknown_files_are_ignored(self):
+        with open(os.path.join(self.directory, "notes.txt"), "w") as fd:
+            fd.write("nothing to see here")
+
+        self.assertEqual(self.watcher.scan(), 0)
+        self.assertFalse(os.path.exists(self.ledger))
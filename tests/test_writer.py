@@ -0,0 +1,149 @@
+from datetime import date
+from decimal import Decimal
+import io
+from unittest import TestCase
+
+from beancount import loader
+from beancount.core import data, flags
+from beancount.core.amount import Amount
+from beancount.parser import printer
+from beancount_ing.writer import write_entries
+
+
+def _transaction(day, payee, narration, *postings):
+    meta = data.new_metadata("umsatz.csv", day)
+    meta["__source__"] = "..."
+
+    return data.Transaction(
+        meta,
+        date(2018, 6, day),
+        flags.FLAG_OKAY,
+        payee,
+        narration,
+        data.EMPTY_SET,
+        data.EMPTY_SET,
+        [
+            data.Posting(account, units, None, None, None, None)
+            for account, units in postings
+        ],
+    )
+
+
+def _balance(day, number):
+    return data.Balance(
+        data.new_metadata("umsatz.csv", day),
+        date(2018, 6, day),
+        "Assets:ING:Extra",
+        Amount(Decimal(number), "EUR"),
+        None,
+        None,
+    )
+
+
+def _amount(number):
+    return Amount(Decimal(number), "EUR")
+
+
+def _parse(string):
+    entries, errors, _ = loader.load_string(string)
+
+    return [
+        entry._replace(meta=None)
+        for entry in entries
+        if not isinstance(entry, data.Open)
+    ]
+
+
+ENTRIES = [
+    _transaction(
+        15,
+        "Arbeitgeber",
+        "Gutschrift Gehalt",
+        ("Assets:ING:Extra", _amount("2000.00")),
+        ("Income:Salary", _amount("-2000.00")),
+    ),
+    _transaction(
+        8,
+        'REWE "Filialen" \\ Voll',
+        "Lastschrift",
+        ("Assets:ING:Extra", _amount("-500.00")),
+    ),
+    _transaction(8, "LIDL", "", ("Assets:ING:Extra", _amount("-34.00"))),
+    _transaction(9, None, "Entgelt", ("Assets:ING:Extra", _amount("-1.00"))),
+    _transaction(
+        10,
+        "Bank",
+        "Zinsen",
+        ("Assets:ING:Extra", _amount("1.00")),
+        ("Income:Interest", None),
+    ),
+    _balance(16, "1466.00"),
+    _balance(8, "0.00"),
+]
+
+
+class WriteEntriesTestCase(TestCase):
+    def _write(self, entries, **kwargs):
+        fd = io.StringIO()
+
+        written = write_entries(entries, fd, **kwargs)
+
+        self.assertEqual(written, len(entries))
+
+        return fd.getvalue()
+
+    def test_same_as_printer(self):
+        expected = "\n".join(printer.format_entry(entry) for entry in ENTRIES)
+
+        self.assertEqual(_parse(self._write(ENTRIES)), _parse(expected))
+
+    def test_identical_to_printer(self):
+        entries = ENTRIES + [
+            _transaction(
+                11,
+                "Bank",
+                "",
+                ("Assets:DE:ING:Girokonto:MaxMustermann:Gemeinsam", _amount("-1.5")),
+                ("Expenses:Fees", _amount("1.5")),
+            ),
+            _transaction(12, None, "", ("Assets:ING:Extra", _amount("-1000000.00"))),
+            _balance(16, "1020.00")._replace(
+                account="Assets:DE:ING:Girokonto:MaxMustermann:Gemeinsam"
+            ),
+        ]
+
+        for entry in entries:
+            self.assertEqual(self._write([entry]), printer.format_entry(entry) + "\n")
+
+        self.assertEqual(len(_parse(self._write(entries))), len(entries))
+
+    def test_fallback_to_printer(self):
+        entry = _transaction(8, "LIDL", "", ("Assets:ING:Extra", _amount("-34.00")))
+        entry = entry._replace(tags=frozenset(["groceries"]))
+        entry.meta["category"] = "Lebensmittel"
+
+        self.assertEqual(self._write([entry]), printer.format_entry(entry) + "\n")
+
+    def test_sort(self):
+        expected = _parse(
+            "\n".join(
+                printer.format_entry(entry)
+                for entry in sorted(ENTRIES, key=data.entry_sortkey)
+            )
+        )
+
+        for chunk_size in (1, 2, 3, 100):
+            output = self._write(ENTRIES, sort=True, chunk_size=chunk_size)
+
+            self.assertEqual(_parse(output), expected)
+
+            # the output itself is sorted, not only the parsed entries
+            self.assertEqual(
+                [line[:10] for line in output.splitlines() if line[:1] == "2"],
+                sorted(line[:10] for line in output.splitlines() if line[:1] == "2"),
+            )
+
+    def test_balance_before_transactions_on_same_day(self):
+        output = self._write([ENTRIES[2], ENTRIES[6]], sort=True)
+
+        self.assertTrue(output.startswith("2018-06-08 balance"))